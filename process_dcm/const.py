@@ -4,6 +4,7 @@ from enum import Enum, Flag, auto, unique
 from typing import cast
 
 RESERVED_CSV = "study_2_patient.csv"
+CSV_BUFFER_SIZE = 1 << 16  # 64 KiB, so mapping CSVs are read and written in few syscalls
 
 
 class ModalityFlag(Flag):
@@ -32,6 +32,7 @@ def process_task(
     mapping: str,
     group: bool,
     tol: int,
+    n_threads: int = 1,
 ) -> tuple[str, str]:
     """Process task."""
     subfolder, out_dir = task
@@ -45,6 +46,7 @@ def process_task(
         mapping=mapping,
         group=group,
         tol=tol,
+        n_threads=n_threads,
     )
 
 
@@ -97,6 +99,52 @@ def main(
 
     Version: 0.4.8
     """
+    run(
+        input_dir,
+        image_format=image_format,
+        output_dir=output_dir,
+        group=group,
+        tol=tol,
+        relative=relative,
+        n_jobs=n_jobs,
+        mapping=mapping,
+        keep=keep,
+        overwrite=overwrite,
+        quiet=quiet,
+    )
+
+
+def run(
+    input_dir: str,
+    image_format: str = "png",
+    output_dir: str = "exported_data",
+    group: bool = False,
+    tol: int = 2,
+    relative: bool = False,
+    n_jobs: int = 1,
+    mapping: str = "",
+    keep: str = "",
+    overwrite: bool = False,
+    quiet: bool = False,
+) -> None:
+    """Process DICOM files in subfolders of `input_dir`; the plain-function counterpart of the `main` command.
+
+    Args:
+        input_dir (str): Input directory containing subfolders with DICOM files.
+        image_format (str, optional): Image format for extracted images (png, jpg, webp). Defaults to "png".
+        output_dir (str, optional): Output directory for extracted images and metadata. Defaults to "exported_data".
+        group (bool, optional): Re-group DICOM files in a given folder by AcquisitionDateTime. Defaults to False.
+        tol (int, optional): Tolerance in seconds for grouping DICOM files by AcquisitionDateTime. Defaults to 2.
+        relative (bool, optional): Save extracted data in folders relative to `input_dir`. Defaults to False.
+        n_jobs (int, optional): Number of parallel jobs. Defaults to 1.
+        mapping (str, optional): Path to CSV containing patient_id to study_id mapping. Defaults to "".
+        keep (str, optional): Keep the specified fields (p, n, d, D, g). Defaults to "".
+        overwrite (bool, optional): Overwrite existing images if found. Defaults to False.
+        quiet (bool, optional): Silence verbosity. Defaults to False.
+
+    Raises:
+        typer.Abort: If `mapping` points to the reserved CSV file name.
+    """
     task_processor = partial(
         process_task,
         image_format=image_format,
@@ -106,6 +154,8 @@ def main(
         mapping=mapping,
         group=group,
         tol=tol,
+        # frames are encoded on threads; split the CPUs with the worker processes rather than oversubscribe them
+        n_threads=max(1, (os.cpu_count() or 1) // max(1, n_jobs)),
     )
 
     if mapping == RESERVED_CSV:
@@ -1,17 +1,19 @@
 """utils module."""
 
 import csv
-import filecmp
 import hashlib
+import io
 import json
 import os
 import shutil
-import tempfile
 import warnings
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 
 import cv2
 import numpy as np
@@ -20,9 +22,10 @@ from natsort import natsorted
 from PIL import Image
 from pydicom.dataset import FileDataset
 from pydicom.filereader import dcmread
+from pydicom.multival import MultiValue
 
 from process_dcm import __version__
-from process_dcm.const import RESERVED_CSV, ImageModality
+from process_dcm.const import CSV_BUFFER_SIZE, RESERVED_CSV, ImageModality
 
 warnings.filterwarnings("ignore", category=UserWarning, message="A value of type *")
 
@@ -36,12 +39,49 @@ class DcmO:
         self.filepath = filepath
 
 
+def parse_fixed_width_date(date_str: str, input_format: str) -> datetime | None:
+    """Parse fixed-width DICOM DA/DT strings by slicing, without going through strptime.
+
+    Only handles "%Y%m%d", "%Y%m%d%H%M%S" and "%Y%m%d%H%M%S.%f" with exactly the digits those formats need;
+    anything else returns None so the caller can fall back to strptime.
+    """
+    digits, fraction = date_str, ""
+    if input_format == "%Y%m%d%H%M%S.%f":
+        digits, _, fraction = date_str.partition(".")
+        if not (1 <= len(fraction) <= 6 and fraction.isascii() and fraction.isdigit()):
+            return None
+    elif input_format not in ("%Y%m%d", "%Y%m%d%H%M%S"):
+        return None
+    if len(digits) != (8 if input_format == "%Y%m%d" else 14) or not (digits.isascii() and digits.isdigit()):
+        return None
+    try:
+        return datetime(
+            int(digits[0:4]),
+            int(digits[4:6]),
+            int(digits[6:8]),
+            int(digits[8:10] or 0),
+            int(digits[10:12] or 0),
+            int(digits[12:14] or 0),
+            int(fraction.ljust(6, "0")),
+        )
+    except ValueError:
+        return None
+
+
 def do_date(date_str: str, input_format: str, output_format: str) -> str:
     """Convert DCM datetime strings to metadata.json string format."""
+    if not isinstance(date_str, str):
+        return ""  # e.g. a multi-valued element, which can't be parsed (nor hashed for the cache)
+    return _do_date(date_str, input_format, output_format)
+
+
+@lru_cache(maxsize=1024)
+def _do_date(date_str: str, input_format: str, output_format: str) -> str:
+    # frames of a study share their dates, so conversions are cached
     if "." not in date_str:
         input_format = input_format.split(".")[0]
     try:
-        dt = datetime.strptime(date_str, input_format)
+        dt = parse_fixed_width_date(date_str, input_format) or datetime.strptime(date_str, input_format)
         return dt.strftime(output_format)
     except Exception:
         return ""
@@ -64,16 +104,14 @@ def set_output_dir(ref_path: str | Path, a_path: str | Path) -> str:
         - If `a_path` is a broken symlink, it returns the combination of `ref_path` and "exported_data".
         - If `a_path` is relative, it returns the combination of `ref_path` and the resolved relative path.
     """
-    path_obj = Path(a_path)
-
-    if path_obj.is_absolute():
+    if os.path.isabs(a_path):
         try:
-            # Resolve symlinks and return real path
-            return path_obj.resolve(strict=False).as_posix()
-        except FileNotFoundError:
+            # Resolve symlinks and return real path; os.path.realpath skips the Path object round trip
+            return os.path.realpath(a_path)
+        except OSError:
             return os.path.join(ref_path, "exported_data")  # Handle broken symlink
     else:
-        return os.path.join(ref_path, path_obj.as_posix())
+        return os.path.join(ref_path, Path(a_path).as_posix())
 
 
 def meta_images(dcm_obj: FileDataset) -> dict:
@@ -103,23 +141,19 @@ def meta_images(dcm_obj: FileDataset) -> dict:
         ss = dcm_obj.get("SharedFunctionalGroupsSequence")
         if "OPTOPOL" in dcm_obj.Manufacturer.upper():
             ss = dcm_obj.get("PerFrameFunctionalGroupsSequence")
-        if ss:
-            try:
-                meta["dimensions_mm"]["width"] = (
-                    dcm_obj.get("Columns", 0) * ss[0].PixelMeasuresSequence[0].PixelSpacing[1]
-                )
-                meta["dimensions_mm"]["height"] = (
-                    dcm_obj.get("Rows", 0) * ss[0].PixelMeasuresSequence[0].PixelSpacing[0]
-                )
-                meta["dimensions_mm"]["depth"] = (dcm_obj.get("NumberOfFrames", 1) - 1) * ss[0].PixelMeasuresSequence[
-                    0
-                ].get("SliceThickness", 0)
-                meta["resolutions_mm"]["width"] = ss[0].PixelMeasuresSequence[0].PixelSpacing[1]
-                meta["resolutions_mm"]["height"] = ss[0].PixelMeasuresSequence[0].PixelSpacing[0]
-                meta["resolutions_mm"]["depth"] = ss[0].PixelMeasuresSequence[0].get("SliceThickness", 0)
-            except AttributeError:
-                pass
-        meta["contents"] = []
+        # look the measures up once rather than walking the sequences for every value; missing ones are skipped
+        # with .get lookups instead of raising and catching AttributeError
+        pms = ss[0].get("PixelMeasuresSequence") if ss else None
+        pm = pms[0] if pms else None
+        if pm is not None and (spacing := pm.get("PixelSpacing")):
+            thickness = pm.get("SliceThickness", 0)
+            meta["dimensions_mm"]["width"] = dcm_obj.get("Columns", 0) * spacing[1]
+            meta["dimensions_mm"]["height"] = dcm_obj.get("Rows", 0) * spacing[0]
+            meta["dimensions_mm"]["depth"] = (dcm_obj.get("NumberOfFrames", 1) - 1) * thickness
+            meta["resolutions_mm"]["width"] = spacing[1]
+            meta["resolutions_mm"]["height"] = spacing[0]
+            meta["resolutions_mm"]["depth"] = thickness
+        contents = meta["contents"] = []
         pp = dcm_obj.get("PerFrameFunctionalGroupsSequence")
         if pp:
             for ii in pp:
@@ -127,13 +161,13 @@ def meta_images(dcm_obj: FileDataset) -> dict:
                 # [640.0, 128.0, 640.0, 640.0]
                 oo = ii.get("OphthalmicFrameLocationSequence")
                 if oo:
-                    cc = ii.OphthalmicFrameLocationSequence[0].ReferenceCoordinates
-                    meta["contents"].append(
+                    cc = oo[0].ReferenceCoordinates
+                    contents.append(
                         {"photo_locations": [{"start": {"x": cc[1], "y": cc[0]}, "end": {"x": cc[3], "y": cc[2]}}]}
                     )
                 else:
                     typer.secho("\nWARN: empty photo_locations", fg=typer.colors.RED)
-                    meta["contents"].append({"photo_locations": []})
+                    contents.append({"photo_locations": []})
 
     return meta
 
@@ -170,9 +204,9 @@ def process_dcm_meta(
     keep_patient_key = "p" in keep
 
     # Read the mapping file if provided
-    patient_to_study = {}
+    patient_to_study: Mapping[str, str] = {}
     if mapping:
-        patient_to_study = dict(read_csv(mapping))
+        patient_to_study = load_mapping(mapping)
 
     original_patient_key = ""
     new_patient_key = ""
@@ -233,8 +267,9 @@ def process_dcm_meta(
     if len(dcm_objs) > 1:
         metadata["series"]["protocol"] = "OCT ART Volume"
 
+    # encode in one go and write once; json.dump would issue a write per encoded chunk
     with open(meta_file, "w") as f:
-        json.dump(metadata, f, indent=4)
+        f.write(json.dumps(metadata, indent=4))
 
     return (new_patient_key, original_patient_key)
 
@@ -244,6 +279,51 @@ process_dcm_meta.__doc__ = (
 )
 
 
+# SeriesDescription tokens for "OP" images, checked in order: the first token found sets the modality
+SERIES_DESCRIPTION_TOKENS: tuple[tuple[str, ImageModality], ...] = (
+    (" IR", ImageModality.SLO_INFRARED),
+    (" BAF ", ImageModality.AUTOFLUORESCENCE_BLUE),
+    (" ICGA ", ImageModality.INDOCYANINE_GREEN_ANGIOGRAPHY),
+    (" FA&ICGA ", ImageModality.FA_ICGA),
+    (" FA ", ImageModality.FLUORESCEIN_ANGIOGRAPHY),
+    (" RF ", ImageModality.RED_FREE),
+    (" BR ", ImageModality.REFLECTANCE_BLUE),
+    (" MColor ", ImageModality.REFLECTANCE_MCOLOR),
+)
+
+
+@lru_cache(maxsize=256)
+def guess_modality(
+    modality: str, manufacturer: str, series_description: str | tuple[str, ...], fov: float | None
+) -> ImageModality | None:
+    """Maps DICOM Modality, Manufacturer, SeriesDescription and HorizontalFieldOfView values to an ImageModality.
+
+    It only depends on these values, so results are cached: a study repeats the same few combinations.
+
+    Args:
+        modality (str): The DICOM Modality, e.g. "OPT" or "OP".
+        manufacturer (str): The upper-cased Manufacturer.
+        series_description (str | tuple[str, ...]): The SeriesDescription, or "" if missing; a multi-valued one is
+            passed as a tuple, so tokens are then matched against whole values as they were on the MultiValue.
+        fov (float | None): The HorizontalFieldOfView, only needed for OPTOS images.
+
+    Returns:
+        ImageModality | None: The guessed modality, or None if the modality is unsupported.
+    """
+    if modality == "OPT":
+        return ImageModality.OCT
+    if modality != "OP":
+        return None
+    if manufacturer == "TOPCON":
+        return ImageModality.COLOUR_PHOTO
+    if manufacturer == "OPTOS" and fov == 200:
+        return ImageModality.PSEUDOCOLOUR_ULTRAWIDEFIELD
+    return next(
+        (guess for token, guess in SERIES_DESCRIPTION_TOKENS if token in series_description),
+        ImageModality.UNKNOWN,
+    )
+
+
 def update_modality(dcm: FileDataset) -> bool:
     """Updates the modality of the given DICOM object based on its Manufacturer and SeriesDescription attributes.
 
@@ -253,34 +333,22 @@ def update_modality(dcm: FileDataset) -> bool:
     Returns:
         bool: True if modality is updated; False if the modality is unsupported.
     """
-    if dcm.Modality == "OPT":
-        dcm.Modality = ImageModality.OCT
-    elif dcm.Modality == "OP":
-        if dcm.Manufacturer.upper() == "TOPCON":
-            dcm.Modality = ImageModality.COLOUR_PHOTO
-        elif dcm.Manufacturer.upper() == "OPTOS" and dcm.HorizontalFieldOfView == 200:
-            dcm.Modality = ImageModality.PSEUDOCOLOUR_ULTRAWIDEFIELD
-        elif " IR" in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.SLO_INFRARED
-        elif " BAF " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.AUTOFLUORESCENCE_BLUE
-        elif " ICGA " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.INDOCYANINE_GREEN_ANGIOGRAPHY
-        elif " FA&ICGA " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.FA_ICGA
-        elif " FA " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.FLUORESCEIN_ANGIOGRAPHY
-        elif " RF " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.RED_FREE
-        elif " BR " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.REFLECTANCE_BLUE
-        elif " MColor " in dcm.get("SeriesDescription", ""):
-            dcm.Modality = ImageModality.REFLECTANCE_MCOLOR
-        else:
-            dcm.Modality = ImageModality.UNKNOWN
-    else:
+    modality = dcm.Modality
+    if modality not in ("OPT", "OP"):
         return False  # Unsupported modality, continue
 
+    manufacturer = series_description = ""
+    fov = None
+    if modality == "OP":
+        manufacturer = dcm.Manufacturer.upper()
+        if manufacturer == "OPTOS":
+            fov = dcm.HorizontalFieldOfView
+            if isinstance(fov, MultiValue):
+                fov = None  # never equal to 200, and not hashable for the cache
+        series_description = dcm.get("SeriesDescription", "")
+        if isinstance(series_description, MultiValue):
+            series_description = tuple(series_description)  # hashable, same `in` semantics
+    dcm.Modality = guess_modality(modality, manufacturer, series_description, fov)
     return True  # Modality updated successfully
 
 
@@ -328,40 +396,51 @@ def group_dcms_by_acquisition_time(dcms: list[FileDataset], tol: int = 2) -> dic
     return grouped_dcms
 
 
-def process_dcm_images(dcm_objs: list, output_dir: str, image_format: str, mapping: str, keep: str) -> tuple[str, str]:
-    """Processes DICOM images and saves them to a directory."""
+def process_dcm_images(
+    dcm_objs: list, output_dir: str, image_format: str, mapping: str, keep: str, n_threads: int = 1
+) -> tuple[str, str]:
+    """Processes DICOM images and saves them to a directory, encoding frames on up to `n_threads` threads."""
     os.makedirs(output_dir, exist_ok=True)
 
-    for dcmO in dcm_objs:
-        # process images
-        arr = dcmO.pixel_array
+    def save_frame(frame: np.ndarray, out_img: str) -> None:
+        array = cv2.normalize(frame, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)  # type: ignore #AWSS
+        Image.fromarray(array).save(out_img)
 
-        if dcmO.NumberOfFrames == 1:
-            arr = np.expand_dims(arr, axis=0)
+    # names are claimed here in order, encoding runs in threads (cv2 and zlib release the GIL)
+    claimed: set[str] = set()
+    with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+        futures = []
+        for dcmO in dcm_objs:
+            # process images
+            arr = dcmO.pixel_array
 
-        for i in range(dcmO.NumberOfFrames):
-            out_img = os.path.join(output_dir, f"{dcmO.Modality.code}-{dcmO.AccessionNumber}_{i}.{image_format}")
-            while os.path.exists(out_img):
-                dcmO.AccessionNumber += 1  # increase group_id
-                out_img = os.path.join(output_dir, f"{dcmO.Modality.code}-{dcmO.AccessionNumber}_{i}.{image_format}")
+            if dcmO.NumberOfFrames == 1:
+                arr = np.expand_dims(arr, axis=0)
 
-            array = cv2.normalize(arr[i], None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)  # type: ignore #AWSS
-            image = Image.fromarray(array)
-            image.save(out_img)
+            for i in range(dcmO.NumberOfFrames):
+                out_img = os.path.join(output_dir, f"{dcmO.Modality.code}-{dcmO.AccessionNumber}_{i}.{image_format}")
+                while out_img in claimed or os.path.exists(out_img):
+                    dcmO.AccessionNumber += 1  # increase group_id
+                    out_img = os.path.join(
+                        output_dir, f"{dcmO.Modality.code}-{dcmO.AccessionNumber}_{i}.{image_format}"
+                    )
+                claimed.add(out_img)
+                futures.append(executor.submit(save_frame, arr[i], out_img))
+        for future in futures:
+            future.result()  # re-raise the first encoding error, if any
     return process_dcm_meta(dcm_objs=dcm_objs, output_dir=output_dir, mapping=mapping, keep=keep)
 
 
 def check_metadata_exists(output_dir: str, group: bool) -> tuple[bool, str]:
     """Check if metadata.json exists in the output directory or its group subfolders."""
-    metadata_path = ""
     if group:
-        # Look for metadata.json in group_* subfolders
-        for subfolder in sorted(os.listdir(output_dir)):
-            if subfolder.startswith("group_"):
-                metadata_path = os.path.join(output_dir, subfolder, "metadata.json")
-                if os.path.exists(metadata_path):
-                    return True, os.path.dirname(metadata_path)
-        return False, os.path.dirname(metadata_path) if os.path.exists(metadata_path) else ""
+        # Look for metadata.json in group_* subfolders, in name order; one scandir pass, no stat per entry
+        with os.scandir(output_dir) as entries:
+            group_dirs = sorted(entry.path for entry in entries if entry.name.startswith("group_") and entry.is_dir())
+        for group_dir in group_dirs:
+            if os.path.isfile(os.path.join(group_dir, "metadata.json")):
+                return True, group_dir
+        return False, ""
     else:
         # Check for metadata.json in the output_dir
         return os.path.exists(os.path.join(output_dir, "metadata.json")), output_dir
@@ -377,6 +456,7 @@ def process_dcm(
     quiet: bool = False,
     group: bool = False,
     tol: int = 2,
+    n_threads: int = 1,
 ) -> tuple[str, str]:
     """Process DICOM files from the input directory and save images in the specified format.
 
@@ -394,13 +474,15 @@ def process_dcm(
         quiet (bool, optional): Silence verbosity. Defaults to False.
         group (bool, optional): Whether to re-group DICOM files by AcquisitionDateTime. Defaults to False.
         tol (int, optional): Tolerance in seconds for grouping DICOM files by AcquisitionDateTime. Defaults to 2.
+        n_threads (int, optional): Number of threads encoding the exported frames. Defaults to 1.
 
     Returns:
         tuple[str, str]: A tuple containing the new patient key and the original patient key.
     """
-    # Load DICOM files from input directory
+    # Load DICOM files from input directory; values over 1 KB (PixelData above all) are only read from disk on
+    # first access, so folders skipped below never pay for their pixels
     dcm_objs = [
-        DcmO(dcmread(os.path.join(input_dir, f)), os.path.join(input_dir, f))
+        DcmO(dcmread(os.path.join(input_dir, f), defer_size="1 KB"), os.path.join(input_dir, f))
         for f in os.listdir(input_dir)
         if f.endswith(".dcm")
     ]
@@ -412,10 +494,10 @@ def process_dcm(
     org_output_dir = output_dir
 
     # Read the mapping file if provided
-    patient_to_study = {}
+    patient_to_study: Mapping[str, str] = {}
     hash_pat_id = get_hash(patient_id)
     if mapping:
-        patient_to_study = dict(read_csv(mapping))
+        patient_to_study = load_mapping(mapping)
 
     if patient_to_study:
         new_patient_key = patient_to_study.get(patient_id, hash_pat_id)
@@ -476,12 +558,22 @@ def process_dcm(
                 )
 
             new, old = process_dcm_images(
-                dcm_objs=group_dcms, output_dir=group_dir, image_format=image_format, mapping=mapping, keep=keep
+                dcm_objs=group_dcms,
+                output_dir=group_dir,
+                image_format=image_format,
+                mapping=mapping,
+                keep=keep,
+                n_threads=n_threads,
             )
 
     else:
         new, old = process_dcm_images(
-            dcm_objs=dcms, output_dir=output_dir, image_format=image_format, mapping=mapping, keep=keep
+            dcm_objs=dcms,
+            output_dir=output_dir,
+            image_format=image_format,
+            mapping=mapping,
+            keep=keep,
+            n_threads=n_threads,
         )
 
     return new, old
@@ -508,12 +600,31 @@ def find_dicom_folders_with_base(root_folder: str) -> tuple[int, str, list[str]]
     Example:
         find_dicom_folders_with_base("/data/patient")
     """
-    unique_subfolders = set()
-    for dirpath, _, filenames in os.walk(root_folder):
-        if any(filename.lower().endswith(".dcm") for filename in filenames):
-            unique_subfolders.add(dirpath)  # Add the full path of subfolders containing DCM files
+    # Same traversal as os.walk (symlinked folders are listed but not entered, unreadable ones are skipped), but a
+    # single os.scandir pass per folder that stops testing file names once a DCM file is found
+    folders = []
+    stack = [root_folder]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            entries = os.scandir(dirpath)
+        except OSError:
+            continue
+        has_dcm = False
+        with entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                elif not has_dcm and entry.name.lower().endswith(".dcm"):
+                    has_dcm = True
+        if has_dcm:
+            folders.append(dirpath)  # Add the full path of subfolders containing DCM files
 
-    folders = list(unique_subfolders)
     len_ins = len(folders)
 
     if len_ins == 0:
@@ -528,15 +639,40 @@ def find_dicom_folders_with_base(root_folder: str) -> tuple[int, str, list[str]]
     return len_ins, base_dir, natsorted(folders)
 
 
+def _nth_newline_from_end(data: bytes, n: int, end: int) -> int:
+    """Index of the n-th newline before `end`, counting backwards, or -1 if there are fewer than n."""
+    for _ in range(n):
+        end = data.rfind(b"\n", 0, end)
+        if end < 0:
+            break
+    return end
+
+
 def get_md5(file_path: Path | str | list[str], minus: int = 0) -> str:
     """Calculate the MD5 checksum of a file or list of files, optionally suppressing lines from the bottom."""
-    md5_hash = hashlib.md5()
+    md5_hash = hashlib.md5(usedforsecurity=False)
+    # one reusable 1 MiB buffer, like hashlib.file_digest, but feeding a single hash across all files
+    buffer = bytearray(1 << 20)
+    view = memoryview(buffer)
 
     def process_file(file: Path | str) -> None:
-        with open(file, "rb") as f:
-            lines = f.readlines()
-            for line in lines[:-minus] if minus > 0 else lines:
-                md5_hash.update(line)
+        with open(file, "rb", buffering=0) as f:
+            if minus <= 0:
+                while size := f.readinto(buffer):
+                    md5_hash.update(view[:size])
+                return
+            # stream in 1 MiB chunks rather than splitting the file into "lines"
+            tail = b""
+            while chunk := f.read(1 << 20):
+                # only the text after the (minus + 1)-th newline from the end can still be dropped
+                tail += chunk
+                cut = _nth_newline_from_end(tail, minus + 1, len(tail))
+                md5_hash.update(tail[: cut + 1])
+                tail = tail[cut + 1 :]
+            if tail:
+                # drop the last `minus` lines; a trailing newline doesn't start a new line
+                cut = _nth_newline_from_end(tail, minus, len(tail) - 1 if tail.endswith(b"\n") else len(tail))
+                md5_hash.update(tail[: cut + 1])
 
     if isinstance(file_path, str | Path):
         process_file(file_path)
@@ -567,32 +703,41 @@ def get_versioned_filename(base_filename: str, version: int) -> str:
     return f"{base}_{version}{ext}"
 
 
-def save_to_temp_file(data: list[list[str]]) -> str:
-    """Saves data to a temporary CSV file.
+def csv_to_string(data: list[list[str]], header: list[str] = []) -> str:
+    """Renders rows as CSV text; write_to_csv writes exactly this text.
 
     Args:
-        data (list[list[str]]): The data to be written to the temporary file.
+        data (list[list[str]]): The rows to render. Each sublist represents a row.
+        header (list[str], optional): An optional list representing the CSV header. Defaults to [] (no header).
 
     Returns:
-        str: The path of the temporary file.
+        str: The CSV text.
     """
-    temp_file = tempfile.NamedTemporaryFile(delete=False, mode="w", newline="", suffix=".csv")
-    temp_file.close()  # Close the NamedTemporaryFile to be reused by write_to_csv
-    write_to_csv(temp_file.name, data, header=["study_id", "patient_id"])
-    return temp_file.name
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(data)
+    return buffer.getvalue()
 
 
-def files_are_identical(file1: str, file2: str) -> bool:
-    """Checks if two files are identical.
+def file_has_content(file_path: str | Path, content: str) -> bool:
+    """Checks if a text file holds exactly the given content.
 
     Args:
-        file1 (str): The path to the first file.
-        file2 (str): The path to the second file.
+        file_path (str|Path): The path to the file.
+        content (str): The expected content.
 
     Returns:
-        bool: True if the files are identical, False otherwise.
+        bool: True if the file's content equals `content`, False otherwise.
     """
-    return filecmp.cmp(file1, file2, shallow=False)
+    if os.path.getsize(file_path) < len(content):
+        return False  # each character takes at least one byte
+    try:
+        with open(file_path, newline="", buffering=CSV_BUFFER_SIZE) as file:
+            return file.read() == content
+    except UnicodeDecodeError:
+        return False
 
 
 def process_and_save_csv(unique_sorted_results: list, reserved_csv: str, quiet: bool = False) -> None:
@@ -600,6 +745,7 @@ def process_and_save_csv(unique_sorted_results: list, reserved_csv: str, quiet:
 
     If the content is identical to the existing file, it leaves the existing file unchanged.
     If the content differs, it renames the existing file with a suffix and saves the new content as the reserved CSV.
+    The new content is rendered and compared in memory, so no temporary file is written.
 
     Args:
         unique_sorted_results (list): The data to be written to the CSV file. Each sublist
@@ -607,28 +753,34 @@ def process_and_save_csv(unique_sorted_results: list, reserved_csv: str, quiet:
         reserved_csv (str): The path to the reserved CSV file.
         quiet (bool, optional): Silence verbosity. Defaults to False.
     """
-    temp_filename = save_to_temp_file(unique_sorted_results)
+    content = csv_to_string(unique_sorted_results, header=["study_id", "patient_id"])
+
+    def save() -> None:
+        with open(reserved_csv, mode="w", newline="", buffering=CSV_BUFFER_SIZE) as file:
+            file.write(content)
 
     if os.path.exists(reserved_csv):
-        if files_are_identical(temp_filename, reserved_csv):
-            os.remove(temp_filename)
+        if file_has_content(reserved_csv, content):
             if not quiet:
                 typer.secho(f"No changes detected. '{reserved_csv}' remains unchanged.", fg="yellow")
         else:
+            # one directory listing instead of an os.path.exists per version already taken
+            with os.scandir(os.path.dirname(reserved_csv) or ".") as entries:
+                existing = {entry.name for entry in entries}
             version = 1
             new_version_filename = get_versioned_filename(reserved_csv, version)
-            while os.path.exists(new_version_filename):
+            while os.path.basename(new_version_filename) in existing:
                 version += 1
                 new_version_filename = get_versioned_filename(reserved_csv, version)
 
             shutil.move(reserved_csv, new_version_filename)
             if not quiet:
                 typer.secho(f"Old '{reserved_csv}' renamed to '{new_version_filename}'", fg="yellow")
-            shutil.move(temp_filename, reserved_csv)
+            save()
             if not quiet:
                 typer.secho(f"New generated mapping saved to '{reserved_csv}'", fg="yellow")
     else:
-        shutil.move(temp_filename, reserved_csv)
+        save()
         if not quiet:
             typer.secho(f"Generated mapping saved to '{reserved_csv}'", fg="blue")
 
@@ -644,9 +796,29 @@ def read_csv(file_path: str) -> list[list[str]]:
     Returns:
         list[list[str]]: A list of rows, where each row is a list of strings representing the CSV data.
     """
-    with open(file_path) as file:
-        reader = csv.reader(file)
-        return list(reader)
+    with open(file_path, newline="", buffering=CSV_BUFFER_SIZE) as file:
+        return list(csv.reader(file))
+
+
+def load_mapping(file_path: str) -> Mapping[str, str]:
+    """Returns the patient ID to study ID mapping stored in a two-column CSV file.
+
+    The file is parsed once per path and modification time, so the folders and groups of a run share one read.
+    The mapping is shared between callers, so it is returned as a read-only view.
+
+    Args:
+        file_path (str): The path to the mapping CSV file.
+
+    Returns:
+        Mapping[str, str]: The study ID for each patient ID in the file.
+    """
+    path = os.path.abspath(file_path)
+    return _load_mapping(path, os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _load_mapping(path: str, mtime_ns: int) -> Mapping[str, str]:
+    return MappingProxyType(dict(read_csv(path)))
 
 
 def write_to_csv(file_path: str | Path, data: list[list[str]], header: list[str] = []) -> None:
@@ -656,22 +828,19 @@ def write_to_csv(file_path: str | Path, data: list[list[str]], header: list[str]
         file_path (str|Path): The path to the CSV file.
         data (list[list[str]]): The data to write to the CSV file. Each sublist represents a row.
         header (list[str], optional): An optional list representing the CSV header.
-                                      Defaults to None.
+                                      Defaults to [] (no header).
     """
     file_path = Path(file_path)
-    with file_path.open(mode="w", newline="") as file:
-        writer = csv.writer(file)
-        if header:
-            writer.writerow(header)
-        writer.writerows(data)
+    with file_path.open(mode="w", newline="", buffering=CSV_BUFFER_SIZE) as file:
+        file.write(csv_to_string(data, header=header))
 
 
 def delete_if_empty(folder_path: str | Path, n_jobs: int = 1) -> bool:
     """Check if a given path is an empty folder (including empty subfolders) and delete it if so.
 
-    This function recursively checks if the specified path and its subfolders are empty.
-    If a folder is empty, it is deleted. The function can operate in parallel for faster
-    processing of large directory structures.
+    This function walks the specified path bottom-up, deleting every subfolder that is empty (or contains only
+    empty subfolders), and then the path itself if nothing is left. Non-empty subfolders are kept, but their
+    empty siblings are still removed. The top-level subfolders can be processed in parallel threads.
 
     Args:
         folder_path (Union[str, Path]): The path to check and possibly delete.
@@ -686,31 +855,28 @@ def delete_if_empty(folder_path: str | Path, n_jobs: int = 1) -> bool:
     if not path.is_dir():
         return False
 
-    def process_folder(folder: Path) -> bool:
-        is_empty = True
-        for item in folder.iterdir():
-            if item.is_file():
-                is_empty = False
-                break
-            if item.is_dir():
-                if not delete_if_empty(item, n_jobs=1):  # Recursive call, but without parallelism
-                    is_empty = False
-                    break
-
-        if is_empty:
-            folder.rmdir()
-        return is_empty
+    def subfolders(folder: str | Path) -> list[str]:
+        # DirEntry.is_dir uses the d_type from readdir; symlinks are kept as content, never followed
+        with os.scandir(folder) as entries:
+            return [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+    def remove_folder(folder: str | Path) -> bool:
+        try:
+            os.rmdir(folder)  # fails if anything is left in it
+        except OSError:
+            return False
+        return True
+
+    def prune(folder: str) -> bool:
+        for subfolder in subfolders(folder):
+            prune(subfolder)
+        return remove_folder(folder)
 
     if n_jobs > 1:
         with ThreadPoolExecutor(max_workers=n_jobs) as executor:
-            futures = [executor.submit(process_folder, subfolder) for subfolder in path.iterdir() if subfolder.is_dir()]
-            results = [future.result() for future in as_completed(futures)]
-
-            # Check if all subfolders were empty and deleted
-            if all(results) and not any(path.glob("*")):
-                path.rmdir()
-                return True
+            list(executor.map(prune, subfolders(path)))
     else:
-        return process_folder(path)
+        for subfolder in subfolders(path):
+            prune(subfolder)
 
-    return False
+    return remove_folder(path)
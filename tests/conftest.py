@@ -1,19 +1,30 @@
 import datetime
 import os
 import re
-import tempfile
-from collections.abc import Generator
+import shutil
+from collections.abc import Callable, Generator, Iterator
+from functools import lru_cache
 from pathlib import Path
 
+import click
 import pydicom
 import pytest
+import typer
+from click.testing import CliRunner
 from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
-from typer.testing import CliRunner
 
 from process_dcm import __version__ as version
 from process_dcm.const import ImageModality
+from process_dcm.main import app, run
 
 bottom = 11
+# pipeline worker processes (-j), split between xdist workers so they don't oversubscribe the CPUs
+jobs = max(1, (os.cpu_count() or 2) // 2 // int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", "1")))
+# accepted md5s of the exported images, shared by every test that exports the same input
+example_dcms_md5 = frozenset({"5ba37cc43233db423394cf98c81d5fbc"})
+dummy_ex_md5 = frozenset({"30b70623445f7c12d8ad773c9738c7ce"})
+# the runner fixture sets NO_COLOR; this is only a fallback for output produced outside it
+ansi_escape = re.compile(r"\x1B[@-_][0-?]*[ -/]*[@-~]")
 
 
 def pytest_report_header():
@@ -21,7 +32,6 @@ def pytest_report_header():
 
 
 def remove_ansi_codes(text):
-    ansi_escape = re.compile(r"\x1B[@-_][0-?]*[ -/]*[@-~]")
     return ansi_escape.sub("", text)
 
 
@@ -35,45 +45,84 @@ def del_file_paths(file_paths: list[str]) -> None:
         None
     """
     for path in file_paths:
-        if not os.path.exists(path):
-            continue
-        if os.path.isfile(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
             os.remove(path)
-        elif os.path.isdir(path):
-            for root, dirs, files in os.walk(path, topdown=False):
-                for name in files:
-                    os.remove(os.path.join(root, name))
-                for name in dirs:
-                    os.rmdir(os.path.join(root, name))
-            os.rmdir(path)
+
+
+def _iter_files(root: str | Path, suffix: str | None = None) -> Iterator[str]:
+    """Yields the path of every file below root, found in a single os.scandir pass, optionally ending in suffix."""
+    stack = [os.fspath(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif suffix is None or entry.name.endswith(suffix):
+                    yield entry.path
+
+
+def walk_files(root: str | Path, suffix: str | None = None) -> list[Path]:
+    """Lists every file below root, optionally keeping only names ending in suffix."""
+    return [Path(path) for path in _iter_files(root, suffix)]
+
+
+def count_files(root: str | Path) -> int:
+    """Counts every file below root without building or sorting a list."""
+    return sum(1 for _ in _iter_files(root))
+
+
+def collect_files(root: str | Path, exclude_name: str = "metadata.json") -> tuple[list[Path], list[Path]]:
+    """Returns all files below root, sorted, and the same list without those named exclude_name."""
+    all_files = sorted(walk_files(root))
+    return all_files, [x for x in all_files if x.name != exclude_name]
 
 
 def create_directory_structure(base_path: Path, structure: dict) -> None:
-    """Creates a directory structure recursively."""
+    """Creates a directory structure recursively, with a single os.makedirs per leaf directory."""
     for item, content in structure.items():
         path = base_path / item
-        if isinstance(content, dict):
-            path.mkdir(exist_ok=True)
+        if not isinstance(content, dict):
+            os.makedirs(base_path, exist_ok=True)
+            path.write_text(content)
+        elif content:
             create_directory_structure(path, content)
         else:
-            path.write_text(content)
+            os.makedirs(path, exist_ok=True)
+
+
+@pytest.fixture(scope="session")
+def cli() -> click.Command:
+    """The Click command behind the Typer app, built once instead of on every CliRunner.invoke."""
+    return typer.main.get_command(app)
 
 
 @pytest.fixture(scope="module")
 def runner():
-    return CliRunner()
+    return CliRunner(env={"NO_COLOR": "1"})
 
 
-@pytest.fixture(scope="module")
-def temp_dir():
-    with tempfile.TemporaryDirectory() as temp_dir:
-        yield temp_dir
+@pytest.fixture(scope="session")
+def example_dcms_run(tmp_path_factory: pytest.TempPathFactory) -> Generator[Callable[[str], Path], None, None]:
+    """Run the pipeline on tests/example-dcms once per distinct `keep` and return its output directory."""
 
+    @lru_cache
+    def _run(keep: str) -> Path:
+        output_dir = tmp_path_factory.mktemp(f"ex_{keep or 'none'}")
+        run("tests/example-dcms", output_dir=str(output_dir), n_jobs=jobs, overwrite=True, keep=keep)
+        return output_dir
+
+    yield _run
+    del_file_paths(["study_2_patient.csv", "study_2_patient_1.csv", "study_2_patient_2.csv"])
 
-@pytest.fixture
-def temp_directory():
-    with tempfile.TemporaryDirectory() as temp_dir:
-        yield Path(temp_dir)
+
+@pytest.fixture(scope="module")
+def mapped_example_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Output of a single mapped pipeline run over tests/example_dir, shared by the tests of a module."""
+    output_dir = tmp_path_factory.mktemp("example_dir")
+    run("tests/example_dir", output_dir=str(output_dir), n_jobs=2, overwrite=True, keep="nDg", mapping="tests/map.csv")
+    return output_dir
 
 
 @pytest.fixture(scope="module")
@@ -244,6 +293,17 @@ def unique_sorted_results():
     ]
 
 
+@pytest.fixture(scope="module")
+def csv_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    return tmp_path_factory.mktemp("csv")
+
+
+@pytest.fixture
+def reserved_csv(csv_dir: Path, request: pytest.FixtureRequest) -> Path:
+    """A reserved CSV path named after the test, so CSV tests share one directory without clashing."""
+    return csv_dir / f"{request.node.name}.csv"
+
+
 @pytest.fixture
 def janitor() -> Generator[list[str], None, None]:
     to_delete: list[str] = []
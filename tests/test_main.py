@@ -1,28 +1,38 @@
-from glob import glob
 from pathlib import Path
-from tempfile import TemporaryDirectory
 
 import pytest
 
 from process_dcm import __version__
 from process_dcm.const import RESERVED_CSV
-from process_dcm.main import app, process_task
+from process_dcm.main import process_task, run
 from process_dcm.utils import get_md5
-from tests.conftest import bottom, remove_ansi_codes
+from tests.conftest import (
+    bottom,
+    collect_files,
+    count_files,
+    del_file_paths,
+    dummy_ex_md5,
+    example_dcms_md5,
+    jobs,
+    walk_files,
+)
 
 
-def test_main_defaults(runner):
-    result = runner.invoke(app, ["input_dir"])
+@pytest.mark.xdist_group("cwd")
+def test_main_defaults(janitor, runner, cli):
+    janitor.append("study_2_patient.csv")
+    result = runner.invoke(cli, ["input_dir"])
     assert result.exit_code == 0
     assert "Processed" in result.output
 
 
-def test_main_version(runner):
-    result = runner.invoke(app, ["--version"])
+def test_main_version(runner, cli):
+    result = runner.invoke(cli, ["--version"])
     assert result.exit_code == 0
     assert f"Process DCM Version: {__version__}" in result.output
 
 
+@pytest.mark.xdist_group("cwd")
 @pytest.mark.parametrize(
     "input_dir, image_format, output_dir, n_jobs, additional_args, expected_output",
     [
@@ -30,7 +40,10 @@ def test_main_version(runner):
         ("path/to/dcm", "jpg", "/tmp/exported_data", 2, ["--quiet"], ""),
     ],
 )
-def test_main_with_options(input_dir, image_format, output_dir, n_jobs, additional_args, expected_output, runner):
+def test_main_with_options(
+    input_dir, image_format, output_dir, n_jobs, additional_args, expected_output, janitor, runner, cli
+):
+    janitor.append("study_2_patient.csv")
     args = [
         input_dir,
         "--image_format",
@@ -43,150 +56,108 @@ def test_main_with_options(input_dir, image_format, output_dir, n_jobs, addition
         *additional_args,
     ]
 
-    result = runner.invoke(app, args)
+    result = runner.invoke(cli, args)
 
     assert result.exit_code == 0
     assert expected_output in result.output
 
 
-def test_cli_without_args(runner):
-    result = runner.invoke(app)
+def test_cli_without_args(runner, cli):
+    result = runner.invoke(cli)
     assert result.exit_code == 2
-    output = remove_ansi_codes(result.stdout)
-    assert "Missing argument 'INPUT_DIR'" in output
+    assert "Missing argument 'INPUT_DIR'" in result.stdout
 
 
-@pytest.mark.parametrize(
-    "md5, meta, keep",
-    [
-        (["5ba37cc43233db423394cf98c81d5fbc"], "27e4fa04ad730718b2509af36743c995", "pndg"),
-        (["5ba37cc43233db423394cf98c81d5fbc"], "3a15fdd18a67b3d4ce7be6164f58f073", "pnDg"),
-        (["5ba37cc43233db423394cf98c81d5fbc"], "ba5973bc8dd8e15aa6bef95bcd248fbf", ""),
-    ],
-)
-def test_main(md5, meta, keep, janitor, runner):
-    janitor.append("study_2_patient.csv")
-    janitor.append("study_2_patient_1.csv")
-    janitor.append("study_2_patient_2.csv")
-    # Create a temporary directory using the tempfile module
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        args = [
-            "tests/example-dcms",
-            "--output_dir",
-            str(output_dir),
-            "--n_jobs",
-            "1",
-            "--overwrite",
-            "--keep",
-            keep,
-        ]
-        result = runner.invoke(app, args)
-        assert result.exit_code == 0
-        tof = sorted(glob(f"{output_dir}/**/*"))
-        of = [x for x in tof if "metadata.json" not in x]
-        assert len(tof) == 51
-        assert get_md5(output_dir / "example-dcms/metadata.json", bottom) == meta
-        assert get_md5(of) in md5
-
-
-def test_main_group(janitor, runner):
+@pytest.mark.xdist_group("cwd")
+def test_main(example_dcms_run):
+    # (keep, metadata md5); the exported images are identical for every keep value
+    cases = [
+        ("pndg", "27e4fa04ad730718b2509af36743c995"),
+        ("pnDg", "3a15fdd18a67b3d4ce7be6164f58f073"),
+        ("", "ba5973bc8dd8e15aa6bef95bcd248fbf"),
+    ]
+    for keep, meta in cases:
+        output_dir = example_dcms_run(keep)
+        tof, of = collect_files(output_dir)
+        assert len(tof) == 51, keep
+        assert get_md5(output_dir / "example-dcms/metadata.json", bottom) == meta, keep
+        assert get_md5(of) in example_dcms_md5, keep
+
+
+@pytest.mark.xdist_group("cwd")
+def test_main_group(janitor, tmp_path):
     janitor.append("study_2_patient.csv")
     janitor.append("study_2_patient_1.csv")
     janitor.append("study_2_patient_2.csv")
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        args = ["tests/example-dcms", "-o", str(output_dir), "-j", "1", "-k", "gD", "-g"]
-        result = runner.invoke(app, args)
-        assert result.exit_code == 0
-        tof = sorted(output_dir.rglob("*.*"))
-        of = sorted(output_dir.rglob("*.png"))
-        assert len(tof) == 51
-        assert get_md5(output_dir / "example-dcms/group_0/metadata.json", bottom) == "5387538e2f018288154ec2e98d4d29b1"
-        assert get_md5(of) in ["5ba37cc43233db423394cf98c81d5fbc"]
-        result = runner.invoke(app, args)
-        assert result.exit_code == 0
-        assert "example-dcms/group_0' already exists with metadata" in result.output
-
-
-def test_main_dummy(janitor, runner):
-    janitor.append("dummy_dir")
-    args = ["tests/dummy_ex", "-o", "dummy_dir", "-k", "p"]
-    result = runner.invoke(app, args)
-    assert result.exit_code == 0
-    tof = sorted(glob("dummy_dir/**/*"))
-    of = [x for x in tof if "metadata.json" not in x]
-    assert len(tof) == 3
-    assert get_md5("dummy_dir/dummy_ex/metadata.json", bottom) == "0693469a3fcf388d89627eb212ace2bc"
-    assert get_md5(of) in ["30b70623445f7c12d8ad773c9738c7ce"]
+    output_dir = tmp_path
+    run("tests/example-dcms", output_dir=str(output_dir), n_jobs=jobs, keep="gD", group=True)
+    tof, of = collect_files(output_dir)
+    assert len(tof) == 51
+    assert get_md5(output_dir / "example-dcms/group_0/metadata.json", bottom) == "5387538e2f018288154ec2e98d4d29b1"
+    assert get_md5(of) in example_dcms_md5
 
 
-def test_main_mapping(janitor, runner):
+@pytest.mark.xdist_group("cwd")
+def test_main_dummy(janitor, tmp_path):
     janitor.append("study_2_patient.csv")
-    janitor.append("study_2_patient_1.csv")
-    janitor.append("study_2_patient_2.csv")
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        args = [
-            "tests/example-dcms",
-            "--output_dir",
-            str(output_dir),
-            "--n_jobs",
-            "1",
-            "--keep",
-            "p",
-            "--mapping",
-            "tests/map.csv",
-            "-r",
-        ]
-        result = runner.invoke(app, args)
-        assert result.exit_code == 0
-        assert "WARN: '--relative' x 'absolute --output_dir'" in result.output
-        tof = sorted(glob(f"{output_dir}/**/*"))
-        of = [x for x in tof if "metadata.json" not in x]
-        assert len(tof) == 51
-        assert get_md5(output_dir / "example-dcms/metadata.json", bottom) == "450e2e40d321a24219c1c9ec15b2c80e"
-        assert get_md5(of) in ["5ba37cc43233db423394cf98c81d5fbc"]
-
-
-def test_main_abort(runner):
+    output_dir = tmp_path / "out"
+    run("tests/dummy_ex", output_dir=str(output_dir), keep="p")
+    tof, of = collect_files(output_dir)
+    assert len(tof) == 3
+    assert get_md5(output_dir / "dummy_ex/metadata.json", bottom) == "0693469a3fcf388d89627eb212ace2bc"
+    assert get_md5(of) in dummy_ex_md5
+
+
+def test_main_mapping(capsys, tmp_path):
+    output_dir = tmp_path
+    run(
+        "tests/example-dcms",
+        output_dir=str(output_dir),
+        n_jobs=jobs,
+        keep="p",
+        mapping="tests/map.csv",
+        relative=True,
+    )
+    assert "WARN: '--relative' x 'absolute --output_dir'" in capsys.readouterr().out
+    tof, of = collect_files(output_dir)
+    assert len(tof) == 51
+    assert get_md5(output_dir / "example-dcms/metadata.json", bottom) == "450e2e40d321a24219c1c9ec15b2c80e"
+    assert get_md5(of) in example_dcms_md5
+
+
+def test_main_abort(runner, cli):
     # Expect the typer.Abort exception to be raised
     args = ["tests/example-dcms", "--keep", "p", "--mapping", RESERVED_CSV]
-    result = runner.invoke(app, args)
-
-    # Strip ANSI codes from the output
-    output = remove_ansi_codes(result.stdout)
+    result = runner.invoke(cli, args)
 
     assert result.exit_code == 1
-    assert output == "Can't use reserved CSV file name: study_2_patient.csv\nAborted.\n"
+    assert result.stdout == "Can't use reserved CSV file name: study_2_patient.csv\nAborted.\n"
 
 
-# skip this test for CI
-def test_main_mapping_example_dir(janitor, runner):
-    janitor.append("study_2_patient.csv")
-    janitor.append("study_2_patient_1.csv")
-    janitor.append("study_2_patient_2.csv")
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        args = ["tests/example_dir", "-o", str(output_dir), "-j", "2", "-w", "-k", "nDg", "-m", "tests/map.csv"]
-        result = runner.invoke(app, args)
-        assert result.exit_code == 0
-        of = sorted(glob(f"{output_dir}/**/**/*"))
-        assert len(of) == 262
-        assert get_md5(output_dir / "012345/20180724_L/metadata.json", bottom) == "93fff12758d6c0f9098e7fd5e8c8304e"
-        assert get_md5(output_dir / "3517807670/20180926_R/metadata.json", bottom) == "b9ff35a765db6b1eaeac4253c93a6044"
-
-
-# skip this test for CI
-def test_main_mapping_example_dir_relative(janitor, runner):
+@pytest.mark.slow
+@pytest.mark.xdist_group("example_dir")
+def test_main_mapping_example_dir(mapped_example_dir):
+    output_dir = mapped_example_dir
+    assert count_files(output_dir) == 262
+    assert get_md5(output_dir / "012345/20180724_L/metadata.json", bottom) == "93fff12758d6c0f9098e7fd5e8c8304e"
+    assert get_md5(output_dir / "3517807670/20180926_R/metadata.json", bottom) == "b9ff35a765db6b1eaeac4253c93a6044"
+
+
+@pytest.mark.slow
+@pytest.mark.xdist_group("example_dir")
+def test_main_mapping_example_dir_rerun(mapped_example_dir, capsys):
+    output_dir = mapped_example_dir
+    del_file_paths([output_dir / "3517807670"])
+    run("tests/example_dir", output_dir=str(output_dir), n_jobs=1, keep="nDg", mapping="tests/map.csv")
+    assert "012345/20180724_L' already exists with metadata" in capsys.readouterr().out
+    assert get_md5(output_dir / "3517807670/20180926_R/metadata.json", bottom) == "b9ff35a765db6b1eaeac4253c93a6044"
+
+
+@pytest.mark.slow
+def test_main_mapping_example_dir_relative(janitor):
     input_dir = "tests/example_dir"
-    janitor.append("study_2_patient.csv")
-    janitor.append("study_2_patient_1.csv")
-    janitor.append("study_2_patient_2.csv")
-    args = ["tests/example_dir", "-o", "dummy", "-j", "2", "-r", "-k", "nDg", "-m", "tests/map.csv"]
-    result = runner.invoke(app, args)
-    assert result.exit_code == 0
-    of = sorted(glob(f"{input_dir}/**/**/dummy/*"))
+    run(input_dir, output_dir="dummy", n_jobs=2, relative=True, keep="nDg", mapping="tests/map.csv")
+    of = [x for x in walk_files(input_dir) if x.parent.name == "dummy"]
     path1 = Path(input_dir) / "012345"
     path2 = Path(input_dir) / "3517807670"
     janitor.append(path1)
@@ -196,49 +167,46 @@ def test_main_mapping_example_dir_relative(janitor, runner):
     assert get_md5(path2 / "20180926_R/dummy/metadata.json", bottom) == "b9ff35a765db6b1eaeac4253c93a6044"
 
 
-def test_process_task():
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        task_data = ("tests/example-dcms/", str(output_dir))
-        image_format = "png"
-        overwrite = True
-        verbose = False
-        keep = ""
-        mapping = ""
-        group = True
-        tol = 2
-        result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
-        assert result == ("0780320450", "bbff7a25-d32c-4192-9330-0bb01d49f746")
-
-
-def test_process_task_optos():
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        task_data = ("tests/example-optos/", str(output_dir))
-        image_format = "png"
-        overwrite = True
-        verbose = True
-        keep = ""
-        mapping = ""
-        group = True
-        tol = 2
-        result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
-        assert result == ("0570586923", "BEH002")
-
-
-def test_process_acquisition_datetime():
-    with TemporaryDirectory() as tmpdirname:
-        output_dir = Path(tmpdirname)
-        task_data = ("tests/cataract/", str(output_dir))
-        image_format = "png"
-        overwrite = True
-        verbose = True
-        keep = ""
-        mapping = ""
-        group = True
-        tol = 2
-        result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
-        assert result == ("0558756784", "20241113-093410")
+def test_process_task(tmp_path):
+    output_dir = tmp_path
+    task_data = ("tests/example-dcms/", str(output_dir))
+    image_format = "png"
+    overwrite = True
+    verbose = False
+    keep = ""
+    mapping = ""
+    group = True
+    tol = 2
+    result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
+    assert result == ("0780320450", "bbff7a25-d32c-4192-9330-0bb01d49f746")
+
+
+def test_process_task_optos(tmp_path):
+    output_dir = tmp_path
+    task_data = ("tests/example-optos/", str(output_dir))
+    image_format = "png"
+    overwrite = True
+    verbose = True
+    keep = ""
+    mapping = ""
+    group = True
+    tol = 2
+    result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
+    assert result == ("0570586923", "BEH002")
+
+
+def test_process_acquisition_datetime(tmp_path):
+    output_dir = tmp_path
+    task_data = ("tests/cataract/", str(output_dir))
+    image_format = "png"
+    overwrite = True
+    verbose = True
+    keep = ""
+    mapping = ""
+    group = True
+    tol = 2
+    result = process_task(task_data, image_format, overwrite, verbose, keep, mapping, group, tol)
+    assert result == ("0558756784", "20241113-093410")
 
 
 # def test_process_many():
@@ -1,12 +1,13 @@
+import hashlib
 import json
 import os
+from datetime import datetime
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from unittest.mock import patch
 
 import pytest
 import typer
 from pydicom.dataset import FileDataset
+from pydicom.multival import MultiValue
 from pytest_mock import MockerFixture
 
 from process_dcm.const import ImageModality
@@ -14,9 +15,13 @@ from process_dcm.utils import (
     check_metadata_exists,
     delete_if_empty,
     do_date,
+    find_dicom_folders_with_base,
     get_md5,
     get_versioned_filename,
+    guess_modality,
+    load_mapping,
     meta_images,
+    parse_fixed_width_date,
     process_and_save_csv,
     process_dcm,
     process_dcm_meta,
@@ -25,7 +30,7 @@ from process_dcm.utils import (
     update_modality,
     write_to_csv,
 )
-from tests.conftest import bottom, create_directory_structure
+from tests.conftest import bottom, create_directory_structure, walk_files
 
 
 def test_meta_images_optopol(dicom_opotopol: FileDataset, mocker: MockerFixture) -> None:
@@ -61,31 +66,50 @@ def test_meta_images_with_photo_locations(dicom_with_photo_locations: FileDatase
     ), "Photo locations not found or incomplete in metadata"
 
 
-def test_absolute_path_symlink() -> None:
-    with patch("pathlib.Path.resolve") as mock_resolve:
-        mock_resolve.return_value = Path("/resolved/path")
-        assert set_output_dir("/home/user", "/symlink") == "/resolved/path"
+def realpath_broken(path: str, *, strict: bool = False) -> str:
+    raise FileNotFoundError(path)
 
 
-def test_absolute_path_broken_symlink() -> None:
-    with patch("pathlib.Path.resolve", side_effect=FileNotFoundError):
-        assert set_output_dir("/home/user", "/broken_symlink") == "/home/user/exported_data"
+def test_absolute_path_symlink(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os.path, "realpath", lambda path, *, strict=False: "/resolved/path")
+    assert set_output_dir("/home/user", "/symlink") == "/resolved/path"
+
+
+def test_absolute_path_broken_symlink(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os.path, "realpath", realpath_broken)
+    assert set_output_dir("/home/user", "/broken_symlink") == "/home/user/exported_data"
 
 
 def test_relative_path() -> None:
     assert set_output_dir("/home/user", "relative/path") == "/home/user/relative/path"
 
 
-def test_broken_symlink_as_relative() -> None:
-    with patch("pathlib.Path.is_absolute", return_value=False):
-        with patch("pathlib.Path.resolve", side_effect=FileNotFoundError):
-            assert set_output_dir("/home/user", "exported_data") == "/home/user/exported_data"
+def test_broken_symlink_as_relative(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(os.path, "isabs", lambda path: False)
+    monkeypatch.setattr(os.path, "realpath", realpath_broken)
+    assert set_output_dir("/home/user", "exported_data") == "/home/user/exported_data"
 
 
 def test_relative_path_with_up() -> None:
     assert set_output_dir("/home/user", "../up/relative") == "/home/user/../up/relative"
 
 
+@pytest.mark.parametrize(
+    "content, minus, kept",
+    [
+        (b"a\nb\nc\n", 1, b"a\nb\n"),
+        (b"a\nb\nc", 1, b"a\nb\n"),
+        (b"a\nb\nc\n", 2, b"a\n"),
+        (b"a\nb\nc\n", 5, b""),
+        (b"", 1, b""),
+    ],
+)
+def test_get_md5_minus(tmp_path: Path, content: bytes, minus: int, kept: bytes) -> None:
+    file_path = tmp_path / "file.txt"
+    file_path.write_bytes(content)
+    assert get_md5(file_path, minus) == hashlib.md5(kept).hexdigest()
+
+
 def test_do_date() -> None:
     input_format = "%Y%m%d%H%M%S.%f"
     output_format = "%Y-%m-%d %H:%M:%S"
@@ -95,6 +119,38 @@ def test_do_date() -> None:
     assert do_date("20230723", "%Y%m%d", "%Y-%m-%d") == "2023-07-23"
     assert do_date("20230723102530.123456", "%Y%m%d%H%M%S.%f", "%Y-%m-%d %H:%M:%S") == "2023-07-23 10:25:30"
     assert do_date("InvalidDate", "%Y%m%d", "%Y-%m-%d") == ""
+    assert do_date(MultiValue(str, ["19000101", "19010101"]), "%Y%m%d", "%Y-%m-%d") == ""
+
+
+@pytest.mark.parametrize(
+    "date_str, input_format",
+    [
+        ("20230723", "%Y%m%d"),
+        ("20230723102530", "%Y%m%d%H%M%S"),
+        ("20230723102530.12", "%Y%m%d%H%M%S.%f"),
+        ("20230723102530.123456", "%Y%m%d%H%M%S.%f"),
+        ("00010101", "%Y%m%d"),
+    ],
+)
+def test_parse_fixed_width_date(date_str: str, input_format: str) -> None:
+    assert parse_fixed_width_date(date_str, input_format) == datetime.strptime(date_str, input_format)
+
+
+@pytest.mark.parametrize(
+    "date_str, input_format",
+    [
+        ("2023723", "%Y%m%d"),  # strptime accepts 1-digit months, left to it
+        ("20231301", "%Y%m%d"),
+        ("20230230", "%Y%m%d"),
+        ("20230723102560", "%Y%m%d%H%M%S"),
+        ("20230723102530.", "%Y%m%d%H%M%S.%f"),
+        ("20230723102530.1234567", "%Y%m%d%H%M%S.%f"),
+        ("2023-07-23", "%Y-%m-%d"),
+        ("InvalidDate", "%Y%m%d"),
+    ],
+)
+def test_parse_fixed_width_date_falls_back(date_str: str, input_format: str) -> None:
+    assert parse_fixed_width_date(date_str, input_format) is None
 
 
 def test_update_modality_opt(dicom_base: FileDataset) -> None:
@@ -159,105 +215,138 @@ def test_update_modality_op_various_descriptions(
     assert dicom_base.Modality == expected_modality
 
 
-def test_process_dcm_meta_with_D_in_keep_and_mapping(dicom_base: FileDataset) -> None:
+def test_update_modality_op_optos_ultrawidefield(dicom_base: FileDataset) -> None:
+    dicom_base.Modality = "OP"
+    dicom_base.Manufacturer = "Optos"
+    dicom_base.HorizontalFieldOfView = 200
+    assert update_modality(dicom_base) is True
+    assert dicom_base.Modality == ImageModality.PSEUDOCOLOUR_ULTRAWIDEFIELD
+
+
+def test_update_modality_op_multivalued(dicom_base: FileDataset) -> None:
+    dicom_base.Modality = "OP"
+    dicom_base.Manufacturer = "Optos"
+    dicom_base.HorizontalFieldOfView = [200, 200]
+    dicom_base.SeriesDescription = "Retina IR \\Other"
+    assert isinstance(dicom_base.SeriesDescription, MultiValue)
+    assert update_modality(dicom_base) is True
+    assert dicom_base.Modality == ImageModality.UNKNOWN
+
+
+@pytest.mark.parametrize(
+    "args, expected_modality",
+    [
+        (("OPT", "", "", None), ImageModality.OCT),
+        (("OP", "", " BAF  IR", None), ImageModality.SLO_INFRARED),  # token priority, not position
+        (("OP", "OPTOS", " FA ", 100), ImageModality.FLUORESCEIN_ANGIOGRAPHY),
+        (("OP", "", "", None), ImageModality.UNKNOWN),
+        (("CT", "", "", None), None),
+    ],
+)
+def test_guess_modality(args: tuple, expected_modality: ImageModality | None) -> None:
+    assert guess_modality(*args) == expected_modality
+
+
+def test_process_dcm_meta_with_D_in_keep_and_mapping(dicom_base: FileDataset, tmp_path: Path) -> None:
     # Call the function with "D" in keep
-    with TemporaryDirectory() as tmpdir:
-        process_dcm_meta([dicom_base], tmpdir, keep="D", mapping="tests/map.csv")
-        rjson = json.load(open(os.path.join(tmpdir, "metadata.json")))
-        assert rjson["patient"]["date_of_birth"] == "1902-01-01"
-        assert rjson["patient"]["patient_key"] == "00123"
+    process_dcm_meta([dicom_base], tmp_path, keep="D", mapping="tests/map.csv")
+    rjson = json.loads((tmp_path / "metadata.json").read_bytes())
+    assert rjson["patient"]["date_of_birth"] == "1902-01-01"
+    assert rjson["patient"]["patient_key"] == "00123"
 
 
-def test_process_and_save_csv(csv_data, unique_sorted_results) -> None:
-    with TemporaryDirectory() as temp_dir:
-        reserved_csv = Path(temp_dir) / "reserved.csv"
+def test_process_and_save_csv(csv_data, unique_sorted_results, reserved_csv) -> None:
+    # Create initial reserved CSV with initial csv_data
+    write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
 
-        # Create initial reserved CSV with initial csv_data
-        write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
+    # Process and save new CSV data
+    process_and_save_csv(unique_sorted_results, reserved_csv)
 
-        # Process and save new CSV data
-        process_and_save_csv(unique_sorted_results, reserved_csv)
+    # Check if reserved CSV was updated
+    updated_data = read_csv(reserved_csv)
+    expected_data = [["study_id", "patient_id"], *unique_sorted_results]
+    assert updated_data == expected_data, f"Expected {expected_data}, but got {updated_data}"
 
-        # Check if reserved CSV was updated
-        updated_data = read_csv(reserved_csv)
-        expected_data = [["study_id", "patient_id"], *unique_sorted_results]
-        assert updated_data == expected_data, f"Expected {expected_data}, but got {updated_data}"
+    # Check if backup was created
+    backup_file = Path(get_versioned_filename(reserved_csv, 1))
+    assert backup_file.exists(), f"Expected backup file {backup_file} to exist"
 
-        # Check if backup was created
-        backup_file = Path(temp_dir) / "reserved_1.csv"
-        assert backup_file.exists(), f"Expected backup file {backup_file} to exist"
+    backup_data = read_csv(backup_file)
+    expected_backup_data = [["study_id", "patient_id"], *csv_data]
+    assert backup_data == expected_backup_data, f"Expected {expected_backup_data}, but got {backup_data}"
 
-        backup_data = read_csv(backup_file)
-        expected_backup_data = [["study_id", "patient_id"], *csv_data]
-        assert backup_data == expected_backup_data, f"Expected {expected_backup_data}, but got {backup_data}"
 
+def test_process_and_save_csv_no_existing_file(unique_sorted_results, reserved_csv):
+    # Process and save new CSV data with no existing reserved CSV
+    process_and_save_csv(unique_sorted_results, reserved_csv)
 
-def test_process_and_save_csv_no_existing_file(unique_sorted_results):
-    with TemporaryDirectory() as temp_dir:
-        reserved_csv = Path(temp_dir) / "reserved.csv"
+    # Check if reserved CSV was created and contains the expected data
+    created_data = read_csv(reserved_csv)
+    expected_data = [["study_id", "patient_id"], *unique_sorted_results]
+    assert created_data == expected_data, f"Expected {expected_data}, but got {created_data}"
 
-        # Process and save new CSV data with no existing reserved CSV
-        process_and_save_csv(unique_sorted_results, reserved_csv)
 
-        # Check if reserved CSV was created and contains the expected data
-        created_data = read_csv(reserved_csv)
-        expected_data = [["study_id", "patient_id"], *unique_sorted_results]
-        assert created_data == expected_data, f"Expected {expected_data}, but got {created_data}"
+def test_process_and_save_csv_with_existing_file(csv_data, unique_sorted_results, reserved_csv):
+    reserved_csv1 = get_versioned_filename(reserved_csv, 1)
 
+    # Create initial reserved CSV with initial csv_data
+    write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
+    write_to_csv(reserved_csv1, csv_data, header=["study_id", "patient_id"])
 
-def test_process_and_save_csv_with_existing_file(csv_data, unique_sorted_results):
-    with TemporaryDirectory() as temp_dir:
-        reserved_csv = Path(temp_dir) / "reserved.csv"
-        reserved_csv1 = get_versioned_filename(reserved_csv, 1)
+    # Process and save new CSV data
+    process_and_save_csv(unique_sorted_results, reserved_csv)
 
-        # Create initial reserved CSV with initial csv_data
-        write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
-        write_to_csv(reserved_csv1, csv_data, header=["study_id", "patient_id"])
+    # Check if reserved CSV was updated
+    updated_data = read_csv(reserved_csv)
+    expected_data = [["study_id", "patient_id"], *unique_sorted_results]
+    assert updated_data == expected_data, f"Expected {expected_data}, but got {updated_data}"
 
-        # Process and save new CSV data
-        process_and_save_csv(unique_sorted_results, reserved_csv)
+    # Check if backup was created
+    backup_file = Path(get_versioned_filename(reserved_csv, 1))
+    assert backup_file.exists(), f"Expected backup file {backup_file} to exist"
 
-        # Check if reserved CSV was updated
-        updated_data = read_csv(reserved_csv)
-        expected_data = [["study_id", "patient_id"], *unique_sorted_results]
-        assert updated_data == expected_data, f"Expected {expected_data}, but got {updated_data}"
+    backup_data = read_csv(backup_file)
+    expected_backup_data = [["study_id", "patient_id"], *csv_data]
+    assert backup_data == expected_backup_data, f"Expected {expected_backup_data}, but got {backup_data}"
 
-        # Check if backup was created
-        backup_file = Path(temp_dir) / "reserved_1.csv"
-        assert backup_file.exists(), f"Expected backup file {backup_file} to exist"
 
-        backup_data = read_csv(backup_file)
-        expected_backup_data = [["study_id", "patient_id"], *csv_data]
-        assert backup_data == expected_backup_data, f"Expected {expected_backup_data}, but got {backup_data}"
+def test_process_and_save_csv_no_changes(csv_data, reserved_csv):
+    # Create reserved CSV with initial csv_data
+    write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
 
+    # Process and save the same CSV data
+    process_and_save_csv(csv_data, reserved_csv)
 
-def test_process_and_save_csv_no_changes(csv_data):
-    with TemporaryDirectory() as temp_dir:
-        reserved_csv = Path(temp_dir) / "reserved.csv"
+    # Check if reserved CSV remains unchanged
+    unchanged_data = read_csv(reserved_csv)
+    expected_data = [["study_id", "patient_id"], *csv_data]
+    assert unchanged_data == expected_data, f"Expected {expected_data}, but got {unchanged_data}"
 
-        # Create reserved CSV with initial csv_data
-        write_to_csv(reserved_csv, csv_data, header=["study_id", "patient_id"])
+    # Check that no backup was created
+    backup_file = Path(get_versioned_filename(reserved_csv, 1))
+    assert not backup_file.exists(), f"Did not expect backup file {backup_file} to exist"
 
-        # Process and save the same CSV data
-        process_and_save_csv(csv_data, reserved_csv)
 
-        # Check if reserved CSV remains unchanged
-        unchanged_data = read_csv(reserved_csv)
-        expected_data = [["study_id", "patient_id"], *csv_data]
-        assert unchanged_data == expected_data, f"Expected {expected_data}, but got {unchanged_data}"
+def test_load_mapping_rereads_modified_file(csv_data, reserved_csv):
+    write_to_csv(reserved_csv, csv_data)
+    mapping = load_mapping(str(reserved_csv))
+    assert mapping == dict(csv_data)
+    assert load_mapping(str(reserved_csv)) is mapping
+    with pytest.raises(TypeError):
+        mapping["study_id_1"] = "patient_id_3"
 
-        # Check that no backup was created
-        backup_file = Path(temp_dir) / "reserved_1.csv"
-        assert not backup_file.exists(), f"Did not expect backup file {backup_file} to exist"
+    write_to_csv(reserved_csv, [["study_id_3", "patient_id_3"]])
+    os.utime(reserved_csv, ns=(0, os.stat(reserved_csv).st_mtime_ns + 1))
+    assert load_mapping(str(reserved_csv)) == {"study_id_3": "patient_id_3"}
 
 
-# skip this test for CI
-def test_process_dcm(temp_dir, input_dir2, mocker):
+@pytest.mark.slow
+def test_process_dcm(tmp_path, input_dir2, mocker):
     mock_secho = mocker.patch("typer.secho")
+    temp_dir = str(tmp_path)
     new_patient_key, original_patient_key = process_dcm(input_dir=input_dir2, output_dir=temp_dir, overwrite=True)
-    output_dir = Path(temp_dir)
-    output_files_initial = list(output_dir.glob("*.png"))
-    assert len(output_files_initial) == 130, "No images were processed initially."
+    n_png = len(walk_files(tmp_path, suffix=".png"))
+    assert n_png == 130, "No images were processed initially."
     assert new_patient_key == "2910892726"
     assert original_patient_key == "010-0001"
 
@@ -266,16 +355,31 @@ def test_process_dcm(temp_dir, input_dir2, mocker):
     assert new_patient_key == ""
     msg = f"Output directory '{temp_dir}' already exists with metadata and images. Skipping..."
     mock_secho.assert_called_with(msg, fg=typer.colors.YELLOW)
-    assert len(list(output_dir.glob("*.png"))) == len(output_files_initial)
+    assert len(walk_files(tmp_path, suffix=".png")) == n_png
 
 
-def test_process_dcm_dummy(temp_dir):
+def test_process_dcm_group_skips_existing_output(tmp_path: Path, mocker: MockerFixture) -> None:
+    mock_secho = mocker.patch("typer.secho")
+    group_dir = tmp_path / "group_0"
+    group_dir.mkdir()
+    (group_dir / "metadata.json").write_text("{}")
+    (group_dir / "image.png").touch()
+
+    assert process_dcm(input_dir="tests/example-dcms", output_dir=str(tmp_path), group=True) == ("", "")
+    msg = f"Output directory '{group_dir}' already exists with metadata and images. Skipping..."
+    mock_secho.assert_called_with(msg, fg=typer.colors.YELLOW)
+    assert sorted(os.listdir(group_dir)) == ["image.png", "metadata.json"]
+
+
+def test_process_dcm_dummy(tmp_path):
+    temp_dir = str(tmp_path)
     new_patient_key, original_patient_key = process_dcm(input_dir="tests/dummy_ex", output_dir=temp_dir, overwrite=True)
     assert new_patient_key, original_patient_key == ("2375458543", "123456")
     assert get_md5(os.path.join(temp_dir, "metadata.json"), bottom) == "b1fb22938cd95348cbcb44a63ed34fcf"
 
 
-def test_process_dcm_dummy_group(temp_dir):
+def test_process_dcm_dummy_group(tmp_path):
+    temp_dir = str(tmp_path)
     new_patient_key, original_patient_key = process_dcm(
         input_dir="tests/dummy_ex", output_dir=temp_dir, overwrite=True, group=True
     )
@@ -283,7 +387,8 @@ def test_process_dcm_dummy_group(temp_dir):
     assert get_md5(os.path.join(temp_dir, "group_UNK", "metadata.json"), bottom) == "b1fb22938cd95348cbcb44a63ed34fcf"
 
 
-def test_process_dcm_dummy_mapping(temp_dir):
+def test_process_dcm_dummy_mapping(tmp_path):
+    temp_dir = str(tmp_path)
     new_patient_key, original_patient_key = process_dcm(
         input_dir="tests/dummy_ex", output_dir=temp_dir, overwrite=True, mapping="tests/map.csv"
     )
@@ -291,51 +396,79 @@ def test_process_dcm_dummy_mapping(temp_dir):
     assert get_md5(os.path.join(temp_dir, "metadata.json"), bottom) == "b1fb22938cd95348cbcb44a63ed34fcf"
 
 
-def test_delete_empty_folder(temp_directory):
-    empty_folder = temp_directory / "empty"
+def test_delete_empty_folder(tmp_path):
+    empty_folder = tmp_path / "empty"
     empty_folder.mkdir()
     assert delete_if_empty(empty_folder)
     assert not empty_folder.exists()
 
 
-def test_delete_nested_empty_folders(temp_directory):
+def test_delete_nested_empty_folders(tmp_path):
     structure = {"parent": {"child1": {}, "child2": {"grandchild": {}}}}
-    create_directory_structure(temp_directory, structure)
-    assert delete_if_empty(temp_directory / "parent")
-    assert not (temp_directory / "parent").exists()
+    create_directory_structure(tmp_path, structure)
+    assert delete_if_empty(tmp_path / "parent")
+    assert not (tmp_path / "parent").exists()
 
 
-def test_non_empty_folder(temp_directory):
+def test_non_empty_folder(tmp_path):
     structure = {"non_empty": {"file.txt": "content"}}
-    create_directory_structure(temp_directory, structure)
-    assert not delete_if_empty(temp_directory / "non_empty")
-    assert (temp_directory / "non_empty").exists()
-    assert (temp_directory / "non_empty" / "file.txt").exists()
+    create_directory_structure(tmp_path, structure)
+    assert not delete_if_empty(tmp_path / "non_empty")
+    assert (tmp_path / "non_empty").exists()
+    assert (tmp_path / "non_empty" / "file.txt").exists()
 
 
-def test_mixed_structure(temp_directory):
+def test_find_dicom_folders_with_base(tmp_path):
+    structure = {
+        "study": {
+            "p10": {"a.DCM": "x"},
+            "p2": {"b.dcm": "x", "nested": {"c.dcm": "x"}},
+            "other": {"notes.txt": "x", "d.dcm": {}},
+        }
+    }
+    create_directory_structure(tmp_path, structure)
+    (tmp_path / "study" / "link").symlink_to(tmp_path / "study" / "p2", target_is_directory=True)
+    base = tmp_path / "study"
+    assert find_dicom_folders_with_base(str(base)) == (
+        3,
+        str(base),
+        [str(base / "p2"), str(base / "p2" / "nested"), str(base / "p10")],
+    )
+    assert find_dicom_folders_with_base(str(base / "p10")) == (1, str(base), [str(base / "p10")])
+    assert find_dicom_folders_with_base(str(base / "other")) == (0, "", [])
+
+
+def test_mixed_structure(tmp_path):
     structure = {"mixed": {"empty1": {}, "empty2": {}, "non_empty": {"file.txt": "content"}}}
-    create_directory_structure(temp_directory, structure)
-    assert not delete_if_empty(temp_directory / "mixed")
-    assert (temp_directory / "mixed").exists()
-    assert not (temp_directory / "mixed" / "empty1").exists()
-    assert not (temp_directory / "mixed" / "empty2").exists()
-    assert (temp_directory / "mixed" / "non_empty").exists()
+    create_directory_structure(tmp_path, structure)
+    assert not delete_if_empty(tmp_path / "mixed")
+    assert (tmp_path / "mixed").exists()
+    assert not (tmp_path / "mixed" / "empty1").exists()
+    assert not (tmp_path / "mixed" / "empty2").exists()
+    assert (tmp_path / "mixed" / "non_empty").exists()
+
+
+def test_symlinked_folder_is_kept(tmp_path):
+    create_directory_structure(tmp_path, {"target": {}, "links": {}})
+    (tmp_path / "links" / "target").symlink_to(tmp_path / "target", target_is_directory=True)
+    assert not delete_if_empty(tmp_path / "links")
+    assert (tmp_path / "links" / "target").is_symlink()
+    assert (tmp_path / "target").exists()
 
 
 def test_non_existent_path():
     assert not delete_if_empty("/path/does/not/exist")
 
 
-def test_file_path(temp_directory):
-    file_path = temp_directory / "file.txt"
+def test_file_path(tmp_path):
+    file_path = tmp_path / "file.txt"
     file_path.write_text("content")
     assert not delete_if_empty(file_path)
     assert file_path.exists()
 
 
 @pytest.mark.parametrize("n_jobs", [2, 4, 8])
-def test_parallel_processing(temp_directory, n_jobs):
+def test_parallel_processing(tmp_path, n_jobs):
     structure = {
         "nested1": {
             "subnested1": {},  # An empty sub-subdirectory
@@ -346,17 +479,17 @@ def test_parallel_processing(temp_directory, n_jobs):
         },
         "empty": {},  # Another top-level empty directory
     }
-    create_directory_structure(temp_directory, structure)
+    create_directory_structure(tmp_path, structure)
 
-    result = delete_if_empty(temp_directory, n_jobs=n_jobs)
+    result = delete_if_empty(tmp_path, n_jobs=n_jobs)
 
     # The top-level directory should be deleted because all subdirectories are empty
     assert result is True, "Expected the top-level directory to be empty and deleted"
-    assert not temp_directory.exists(), "Expected the top-level directory to no longer exist"
+    assert not tmp_path.exists(), "Expected the top-level directory to no longer exist"
 
 
 @pytest.mark.parametrize("n_jobs", [2, 4, 8])
-def test_parallel_processing_mixed_structure(temp_directory: Path, n_jobs: int) -> None:
+def test_parallel_processing_mixed_structure(tmp_path: Path, n_jobs: int) -> None:
     structure = {
         "nested1": {
             "subnested1": {},  # An empty sub-subdirectory
@@ -365,95 +498,95 @@ def test_parallel_processing_mixed_structure(temp_directory: Path, n_jobs: int)
         "empty": {},  # Another top-level empty directory
         "file.txt": "content",  # A file in the top-level directory, should prevent deletion
     }
-    create_directory_structure(temp_directory, structure)
+    create_directory_structure(tmp_path, structure)
 
-    result = delete_if_empty(temp_directory, n_jobs=n_jobs)
+    result = delete_if_empty(tmp_path, n_jobs=n_jobs)
 
     # The top-level directory should not be deleted because it contains a file
     assert result is False, "Expected the top-level directory to not be deleted due to the presence of files"
-    assert temp_directory.exists(), "Expected the top-level directory to still exist"
-    assert (temp_directory / "file.txt").exists(), "Expected the file to still exist in the top-level directory"
+    assert tmp_path.exists(), "Expected the top-level directory to still exist"
+    assert (tmp_path / "file.txt").exists(), "Expected the file to still exist in the top-level directory"
 
 
-def test_check_metadata_exists_no_group(temp_directory: str):
+def test_check_metadata_exists_no_group(tmp_path: Path):
     """Test when group is False and metadata.json exists."""
-    metadata_path = os.path.join(temp_directory, "metadata.json")
+    metadata_path = os.path.join(tmp_path, "metadata.json")
     with open(metadata_path, "w") as f:
         json.dump({}, f)
 
-    result, path = check_metadata_exists(temp_directory, group=False)
+    result, path = check_metadata_exists(tmp_path, group=False)
     assert result is True
-    assert path == temp_directory
+    assert path == tmp_path
 
 
-def test_check_metadata_exists_no_group_not_exists(temp_directory: str):
+def test_check_metadata_exists_no_group_not_exists(tmp_path: Path):
     """Test when group is False and metadata.json doesn't exist."""
-    result, path = check_metadata_exists(temp_directory, group=False)
+    result, path = check_metadata_exists(tmp_path, group=False)
     assert result is False
-    assert path == temp_directory
+    assert path == tmp_path
 
 
-def test_check_metadata_exists_group(temp_directory: str):
+def test_check_metadata_exists_group(tmp_path: Path):
     """Test when group is True and metadata.json exists in a group folder."""
-    group_dir = os.path.join(temp_directory, "group_1")
+    group_dir = os.path.join(tmp_path, "group_1")
     os.makedirs(group_dir)
     metadata_path = os.path.join(group_dir, "metadata.json")
     with open(metadata_path, "w") as f:
         json.dump({}, f)
 
-    result, path = check_metadata_exists(temp_directory, group=True)
+    result, path = check_metadata_exists(tmp_path, group=True)
     assert result is True
     assert path == group_dir
 
 
-def test_check_metadata_exists_group_not_exists(temp_directory: str):
+def test_check_metadata_exists_group_not_exists(tmp_path: Path):
     """Test when group is True and metadata.json doesn't exist in any group folder."""
-    group_dir = temp_directory / "group_1"
+    group_dir = tmp_path / "group_1"
     os.makedirs(group_dir)
 
-    result, path = check_metadata_exists(temp_directory, group=True)
+    result, path = check_metadata_exists(tmp_path, group=True)
     assert result is False
     assert path == ""
 
 
-def test_check_metadata_exists_group_multiple(temp_directory: str):
+def test_check_metadata_exists_group_multiple(tmp_path: Path):
     """Test when group is True and metadata.json exists in multiple group folders."""
     for i in range(1, 4):
-        group_dir = os.path.join(temp_directory, f"group_{i}")
+        group_dir = os.path.join(tmp_path, f"group_{i}")
         os.makedirs(group_dir)
         if i != 2:  # Skip group_2 to test it finds the first occurrence
             metadata_path = os.path.join(group_dir, "metadata.json")
             with open(metadata_path, "w") as f:
                 json.dump({}, f)
 
-    result, path = check_metadata_exists(temp_directory, group=True)
+    result, path = check_metadata_exists(tmp_path, group=True)
     assert result is True
-    assert path == os.path.join(temp_directory, "group_1")
+    assert path == os.path.join(tmp_path, "group_1")
 
 
-def test_check_metadata_exists_non_group_folders(temp_directory: str):
+def test_check_metadata_exists_non_group_folders(tmp_path: Path):
     """Test when there are non-group folders present."""
-    os.makedirs(os.path.join(temp_directory, "not_a_group"))
-    os.makedirs(os.path.join(temp_directory, "group_1"))
+    os.makedirs(os.path.join(tmp_path, "not_a_group"))
+    os.makedirs(os.path.join(tmp_path, "group_1"))
 
-    result, path = check_metadata_exists(temp_directory, group=True)
+    result, path = check_metadata_exists(tmp_path, group=True)
     assert result is False
 
 
-def test_check_metadata_exists_empty_dir(temp_directory: str):
+def test_check_metadata_exists_empty_dir(tmp_path: Path):
     """Test with an empty directory for both group True and False."""
-    assert check_metadata_exists(temp_directory, group=False) == (False, temp_directory)
-    assert check_metadata_exists(temp_directory, group=True) == (False, "")
+    assert check_metadata_exists(tmp_path, group=False) == (False, tmp_path)
+    assert check_metadata_exists(tmp_path, group=True) == (False, "")
 
 
-def test_check_metadata_exists_case_sensitivity(temp_directory: str):
+def test_check_metadata_exists_case_sensitivity(tmp_path: Path):
     """Test case sensitivity of group folder names."""
-    group_dir = os.path.join(temp_directory, "GROUP_1")
+    group_dir = os.path.join(tmp_path, "GROUP_1")
     os.makedirs(group_dir)
     metadata_path = os.path.join(group_dir, "metadata.json")
     with open(metadata_path, "w") as f:
         json.dump({}, f)
 
-    result, path = check_metadata_exists(temp_directory, group=True)
+    result, path = check_metadata_exists(tmp_path, group=True)
     assert result is False
     assert path == ""